@@ -1,5 +1,6 @@
 # main.py (COMPLETELY FIXED WITH PROPER AUTHENTICATION)
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_file, abort
+from werkzeug.security import safe_join
 import sqlite3
 import os
 import json
@@ -7,13 +8,55 @@ from datetime import datetime, timedelta
 import hashlib
 import secrets
 import re
+import gzip
+import glob
+import shutil
+import tempfile
+import time
+import click
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import brotli
+except ImportError:  # Fall back to gzip if Brotli isn't installed
+    brotli = None
 
 app = Flask(__name__)
 app.secret_key = "supersecretkey"
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)
 
 # Database configuration
-DATABASE = 'energy_manager.db'
+DATABASE = 'energy_manager.db'   # Catalog: users, password_resets, energy_tips
+
+# Sharding configuration: per-user tables are split across SHARD_COUNT files by user_id
+SHARD_DIR = 'shards'
+SHARD_COUNT = 4
+SHARDED_TABLES = ('energy_usage',)
+REBALANCE_TIMEOUT = 60           # Seconds a rebalance waits for a shard's write lock
+shard_pool = ThreadPoolExecutor(max_workers=SHARD_COUNT)
+db_initialized = False
+db_init_lock = threading.Lock()
+
+# Snapshot configuration
+BACKUP_DIR = 'backups'
+RESET_BACKUP_DIR = os.path.join(BACKUP_DIR, 'reset')   # Taken before /reset-db, never rotated
+BACKUP_KEEP = 7                  # Number of compressed snapshot sets kept
+BACKUP_PAGES_PER_STEP = 64       # Pages copied before yielding to other writers
+BACKUP_STEP_PAUSE = 0.005        # Seconds to sleep between backup steps
+BACKUP_MAX_RESTARTS = 3          # Restarts tolerated before copying in one step
+
+# Compression configuration
+ASSET_BUILD_DIR = os.path.join(app.root_path, 'dist')   # Output of `flask build-assets`, served at /assets/
+ASSET_MANIFEST = os.path.join(ASSET_BUILD_DIR, 'manifest.json')
+ASSET_MAX_AGE = 365 * 24 * 60 * 60   # Fingerprinted files never change, cache for a year
+COMPRESS_MIN_SIZE = 500              # Bytes; smaller bodies aren't worth compressing
+COMPRESS_LEVEL = 6                   # gzip level for dynamic responses
+BROTLI_QUALITY = 5                   # brotli quality for dynamic responses
+COMPRESS_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'application/json',
+                      'application/javascript', 'text/javascript', 'image/svg+xml'}
+COMPRESS_CACHED_ENDPOINTS = {'common_devices'}   # Endpoints whose responses never change
 
 def hash_password(password):
     """Hash a password for storing."""
@@ -23,9 +66,12 @@ def verify_password(stored_password, provided_password):
     """Verify a stored password against one provided by user"""
     return stored_password == hashlib.sha256(provided_password.encode()).hexdigest()
 
-def init_db():
-    """Initialize the database and create tables if they don't exist"""
-    conn = sqlite3.connect(DATABASE)
+def init_catalog(database=DATABASE):
+    """Create the global tables in the catalog database if they don't exist"""
+    conn = sqlite3.connect(database)
+    conn.execute('PRAGMA journal_mode=WAL')
+    # One transaction, so workers starting together don't both seed the tips
+    conn.execute('BEGIN IMMEDIATE')
     cursor = conn.cursor()
     
     # User profiles table with password
@@ -56,21 +102,6 @@ def init_db():
         )
     ''')
     
-    # Energy usage table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS energy_usage (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            device_name TEXT NOT NULL,
-            power_watts INTEGER NOT NULL,
-            hours_per_day REAL NOT NULL,
-            cost_per_kwh REAL DEFAULT 8.0,
-            monthly_cost REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
     # Energy savings tips for Indian context
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS energy_tips (
@@ -145,12 +176,462 @@ def init_db():
     conn.commit()
     conn.close()
 
-def get_db_connection():
-    """Get a database connection"""
-    conn = sqlite3.connect(DATABASE)
+def init_shard(database):
+    """Create the per-user tables in a shard database if they don't exist"""
+    conn = sqlite3.connect(database)
+    conn.execute('PRAGMA journal_mode=WAL')
+    cursor = conn.cursor()
+    
+    # Energy usage table (users live in the catalog, so no foreign key here)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS energy_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            device_name TEXT NOT NULL,
+            power_watts INTEGER NOT NULL,
+            hours_per_day REAL NOT NULL,
+            cost_per_kwh REAL DEFAULT 8.0,
+            monthly_cost REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_energy_usage_user ON energy_usage (user_id)')
+    
+    # Rows copied in by rebalance_shards whose original isn't deleted yet
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rebalance_log (
+            source TEXT NOT NULL,
+            source_table TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            PRIMARY KEY (source, source_table, source_id)
+        )
+    ''')
+    
+    conn.commit()
+    conn.close()
+
+def init_db():
+    """Initialize the catalog and every shard, moving any legacy per-user rows"""
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    init_catalog()
+    for path in all_shard_paths():
+        init_shard(path)
+    rebalance_shards(include_shards=False)
+
+def ensure_db():
+    """Run init_db once per process, however the app was started.
+
+    `flask run` and gunicorn never reach the __main__ block, so the first
+    database access creates missing shards and migrates legacy rows.
+    """
+    global db_initialized
+    if db_initialized:
+        return
+    with db_init_lock:
+        if not db_initialized:
+            init_db()
+            db_initialized = True
+
+def shard_index(user_id):
+    """Pick the shard for a user by hashing their id"""
+    digest = hashlib.md5(str(user_id).encode()).hexdigest()
+    return int(digest, 16) % SHARD_COUNT
+
+def shard_path(index):
+    """Path of the shard database file with the given index"""
+    base = os.path.splitext(os.path.basename(DATABASE))[0]
+    return os.path.join(SHARD_DIR, f"{base}-shard{index}.db")
+
+def all_shard_paths():
+    """Paths of all configured shard databases"""
+    return [shard_path(index) for index in range(SHARD_COUNT)]
+
+def all_database_paths():
+    """The catalog followed by every shard"""
+    return [DATABASE] + all_shard_paths()
+
+def _initializer_for(database):
+    """Schema initializer for the catalog or a shard"""
+    return init_catalog if database == DATABASE else init_shard
+
+def get_db_connection(user_id=None):
+    """Get a database connection.
+
+    Without a user_id this is the catalog (users, password resets, tips).
+    With a user_id it is the shard holding that user's energy data.
+    """
+    ensure_db()
+    database = DATABASE if user_id is None else shard_path(shard_index(user_id))
+    conn = sqlite3.connect(database)
+    conn.execute('PRAGMA journal_mode=WAL')   # Readers (and snapshots) never block writers
     conn.row_factory = sqlite3.Row 
     return conn
 
+def query_all_shards(query, params=()):
+    """Run a read query on every shard in parallel and concatenate the rows.
+
+    Only use this for plain row fetches: ORDER BY, LIMIT and aggregates would
+    apply per shard. Use query_merged for anything else.
+    Returns (column_names, rows).
+    """
+    ensure_db()
+    
+    def run(path):
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(query, params)
+            rows = cursor.fetchall()
+            columns = [description[0] for description in cursor.description or []]
+            return columns, rows
+        finally:
+            conn.close()
+    
+    results = list(shard_pool.map(run, all_shard_paths()))
+    columns = next((columns for columns, _ in results if columns), [])
+    rows = [row for _, shard_rows in results for row in shard_rows]
+    return columns, rows
+
+def query_merged(query, params=()):
+    """Run a SELECT over the merged shards, with catalog tables available.
+
+    Every sharded table is fetched from all shards in parallel and loaded
+    into an in-memory database that has the catalog attached, then the
+    query runs once there. Joins with users, ORDER BY, LIMIT and aggregates
+    therefore see all users' rows, exactly as before sharding.
+    Returns (column_names, rows).
+    """
+    ensure_db()
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("ATTACH DATABASE ? AS catalog", (DATABASE,))
+        schema_conn = sqlite3.connect(shard_path(0))
+        try:
+            schemas = {table: schema_conn.execute(f"PRAGMA table_info({table})").fetchall()
+                       for table in SHARDED_TABLES}
+        finally:
+            schema_conn.close()
+        
+        for table in SHARDED_TABLES:
+            # No primary key: ids are only unique within a shard
+            column_defs = ', '.join(f"{column[1]} {column[2]}" for column in schemas[table])
+            conn.execute(f"CREATE TABLE main.{table} ({column_defs})")
+            columns, rows = query_all_shards(f"SELECT * FROM {table}")
+            if rows:
+                conn.executemany(
+                    f"INSERT INTO main.{table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    [tuple(row) for row in rows]
+                )
+        
+        cursor = conn.execute(query, params)
+        rows = cursor.fetchall()
+        columns = [description[0] for description in cursor.description or []]
+        return columns, rows
+    finally:
+        conn.close()
+
+def mentions_sharded_table(query):
+    """Check whether a SQL statement touches a per-user (sharded) table"""
+    return any(re.search(rf'\b{table}\b', query, re.IGNORECASE) for table in SHARDED_TABLES)
+
+def _table_exists(conn, table):
+    """Check whether a table exists in a database"""
+    cursor = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (table,))
+    return cursor.fetchone() is not None
+
+def _move_rows(source, source_path, table, logged):
+    """Move one table's misplaced rows out of a write-locked source database.
+
+    Each batch is committed to its target together with rebalance_log
+    entries, then deleted from the source; the caller commits the deletes.
+    Rows a previous, interrupted run already copied are only deleted.
+    Every log entry involved is added to `logged` (target path -> entries)
+    so the caller can clear them once the deletes are committed.
+    """
+    source_name = os.path.basename(source_path)
+    targets = [path for path in all_shard_paths() if os.path.abspath(path) != os.path.abspath(source_path)]
+    
+    for target_path in targets:
+        target = sqlite3.connect(target_path, timeout=REBALANCE_TIMEOUT)
+        try:
+            copied = [(source_name, table, row[0]) for row in target.execute(
+                "SELECT source_id FROM rebalance_log WHERE source = ? AND source_table = ?", (source_name, table))]
+        finally:
+            target.close()
+        source.executemany(f"DELETE FROM {table} WHERE id = ?", [(entry[2],) for entry in copied])
+        logged.setdefault(target_path, []).extend(copied)
+    
+    rows_by_shard = {}
+    for row in source.execute(f"SELECT * FROM {table}"):
+        target_path = shard_path(shard_index(row['user_id']))
+        if target_path in targets:
+            rows_by_shard.setdefault(target_path, []).append(row)
+    
+    moved = 0
+    for target_path, rows in rows_by_shard.items():
+        # Ids are per shard, so let the target assign new ones
+        columns = [column for column in rows[0].keys() if column != 'id']
+        entries = [(source_name, table, row['id']) for row in rows]
+        target = sqlite3.connect(target_path, timeout=REBALANCE_TIMEOUT)
+        try:
+            target.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [tuple(row[column] for column in columns) for row in rows]
+            )
+            target.executemany("INSERT INTO rebalance_log (source, source_table, source_id) VALUES (?, ?, ?)", entries)
+            target.commit()
+        finally:
+            target.close()
+        
+        source.executemany(f"DELETE FROM {table} WHERE id = ?", [(entry[2],) for entry in entries])
+        logged.setdefault(target_path, []).extend(entries)
+        moved += len(rows)
+    
+    # Per-user tables no longer belong in the catalog
+    if source_path == DATABASE:
+        source.execute(f"DROP TABLE {table}")
+    return moved
+
+def rebalance_shards(include_shards=True):
+    """Move per-user rows to the shard their user_id now hashes to.
+
+    Picks up rows left in the catalog from before sharding, and (unless
+    include_shards is False) rows in any shard file under SHARD_DIR,
+    including files left over from a larger SHARD_COUNT. Each source is
+    write-locked while its rows move, so concurrent runs (several workers
+    starting at once) take turns. Copies are logged in the target before
+    the source rows are deleted, so an interrupted run is finished by the
+    next one rather than leaving duplicates.
+    Returns the number of rows moved.
+    """
+    sources = [DATABASE]
+    if include_shards:
+        base = os.path.splitext(os.path.basename(DATABASE))[0]
+        sources += sorted(glob.glob(os.path.join(SHARD_DIR, f"{base}-shard*.db")))
+    
+    moved = 0
+    for source_path in sources:
+        logged = {}
+        source = sqlite3.connect(source_path, timeout=REBALANCE_TIMEOUT, isolation_level=None)
+        source.row_factory = sqlite3.Row
+        try:
+            source.execute("BEGIN IMMEDIATE")
+            try:
+                for table in SHARDED_TABLES:
+                    if _table_exists(source, table):
+                        moved += _move_rows(source, source_path, table, logged)
+                source.execute("COMMIT")
+            except Exception:
+                source.execute("ROLLBACK")
+                raise
+        finally:
+            source.close()
+        
+        # The originals are gone for good, so their log entries can go too
+        for target_path, entries in logged.items():
+            target = sqlite3.connect(target_path, timeout=REBALANCE_TIMEOUT)
+            try:
+                target.executemany(
+                    "DELETE FROM rebalance_log WHERE source = ? AND source_table = ? AND source_id = ?", entries)
+                target.commit()
+            finally:
+                target.close()
+    return moved
+
+class _BackupRestarted(Exception):
+    """Raised to abandon a stepped backup that keeps being restarted"""
+
+def copy_database(source_path, dest_path, pages=BACKUP_PAGES_PER_STEP):
+    """Copy a SQLite database with the online backup API.
+
+    With pages > 0 the source is read a few pages at a time and we sleep
+    between steps. SQLite restarts a stepped backup whenever another
+    connection writes to the source; after BACKUP_MAX_RESTARTS restarts we
+    fall back to a single step so a steady stream of writes can't starve
+    the backup. The databases run in WAL mode, where that single step is an
+    ordinary read and writers carry on while it runs.
+    With pages = -1 the whole copy happens in one step, which keeps the
+    lock on the destination as short as possible.
+    """
+    source = sqlite3.connect(source_path)
+    dest = sqlite3.connect(dest_path)
+    state = {'remaining': None, 'restarts': 0}
+    
+    def yield_between_steps(status, remaining, total):
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        state['remaining'] = remaining
+        time.sleep(BACKUP_STEP_PAUSE)
+    
+    try:
+        if pages > 0:
+            try:
+                source.backup(dest, pages=pages, progress=yield_between_steps)
+                return
+            except _BackupRestarted:
+                pass
+        source.backup(dest)
+    finally:
+        dest.close()
+        source.close()
+
+def _snapshot_prefix(database):
+    """File name prefix used for snapshots of a database"""
+    return os.path.splitext(os.path.basename(database))[0] + '-'
+
+def parse_snapshot(snapshot_path):
+    """Work out which database and backup run a snapshot file belongs to.
+
+    Returns (database, stamp), or (None, None) for unrelated files.
+    """
+    name = os.path.basename(snapshot_path)
+    if not name.endswith('.db.gz'):
+        return None, None
+    for database in all_database_paths():
+        prefix = _snapshot_prefix(database)
+        stamp = name[len(prefix):-len('.db.gz')]
+        if name.startswith(prefix) and stamp[:1].isdigit():
+            return database, stamp
+    return None, None
+
+def list_snapshot_sets(complete_only=True, directory=BACKUP_DIR):
+    """List backup runs as (stamp, {database: snapshot_path}), oldest first.
+
+    A set is complete when it has a snapshot of the catalog and of every
+    shard; only complete sets are safe to restore.
+    """
+    sets = {}
+    for snapshot_path in glob.glob(os.path.join(directory, '*.db.gz')):
+        database, stamp = parse_snapshot(snapshot_path)
+        if database:
+            sets.setdefault(stamp, {})[database] = snapshot_path
+    
+    databases = set(all_database_paths())
+    return sorted((stamp, snapshots) for stamp, snapshots in sets.items()
+                  if not complete_only or set(snapshots) == databases)
+
+def rotate_snapshots(keep=BACKUP_KEEP):
+    """Keep the newest `keep` complete snapshot sets and delete anything older"""
+    complete = list_snapshot_sets()
+    if len(complete) <= keep:
+        return
+    oldest_kept = complete[-keep][0] if keep > 0 else None
+    for stamp, snapshots in list_snapshot_sets(complete_only=False):
+        if oldest_kept is None or stamp < oldest_kept:
+            for snapshot_path in snapshots.values():
+                os.remove(snapshot_path)
+
+def create_snapshot(database, stamp, directory=BACKUP_DIR):
+    """Take a gzip-compressed snapshot of a live database for backup run `stamp`"""
+    os.makedirs(directory, exist_ok=True)
+    snapshot_path = os.path.join(directory, f"{_snapshot_prefix(database)}{stamp}.db.gz")
+    
+    fd, tmp_path = tempfile.mkstemp(suffix='.db', dir=directory)
+    os.close(fd)
+    try:
+        copy_database(database, tmp_path)
+        with open(tmp_path, 'rb') as src, gzip.open(snapshot_path + '.part', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(snapshot_path + '.part', snapshot_path)
+    finally:
+        os.remove(tmp_path)
+    return snapshot_path
+
+def create_snapshot_set(directory=BACKUP_DIR):
+    """Snapshot the catalog and every shard under one stamp.
+
+    Old sets are rotated out of BACKUP_DIR; sets in any other directory
+    (such as RESET_BACKUP_DIR) are kept until deleted by hand.
+    """
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    for database in all_database_paths():
+        if not os.path.exists(database):
+            _initializer_for(database)(database)
+        create_snapshot(database, stamp, directory)
+    if directory == BACKUP_DIR:
+        rotate_snapshots()
+    return stamp
+
+def _swap_in(fresh_path, database):
+    """Replace the contents of a live database with another database file.
+
+    The backup API writes into the open database inside a single
+    transaction, so other connections see either the old or the new
+    contents and never a missing or half-written file.
+    """
+    copy_database(fresh_path, database, pages=-1)
+
+def _temp_database_path(database):
+    """Create an empty temporary file next to a database"""
+    fd, tmp_path = tempfile.mkstemp(suffix='.db', dir=os.path.dirname(os.path.abspath(database)))
+    os.close(fd)
+    return tmp_path
+
+def restore_snapshot(snapshot_path, database=DATABASE):
+    """Restore a compressed snapshot into a (possibly live) database"""
+    tmp_path = _temp_database_path(database)
+    try:
+        with gzip.open(snapshot_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        _swap_in(tmp_path, database)
+    finally:
+        os.remove(tmp_path)
+
+def restore_snapshot_set(stamp=None, directory=BACKUP_DIR):
+    """Restore the catalog and every shard from one complete snapshot set.
+
+    Defaults to the newest complete set. Returns the stamp restored, or
+    None if there is no complete set with that stamp.
+    """
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    sets = dict(list_snapshot_sets(directory=directory))
+    if stamp is None and sets:
+        stamp = max(sets)
+    if stamp not in sets:
+        return None
+    for database, snapshot_path in sets[stamp].items():
+        restore_snapshot(snapshot_path, database)
+    return stamp
+
+def has_user_data():
+    """Check whether any users or energy data exist that a reset would lose"""
+    if not os.path.exists(DATABASE):
+        return False
+    conn = sqlite3.connect(DATABASE)
+    try:
+        if _table_exists(conn, 'users') and conn.execute('SELECT 1 FROM users LIMIT 1').fetchone():
+            return True
+    finally:
+        conn.close()
+    
+    existing_shards = [path for path in all_shard_paths() if os.path.exists(path)]
+    for path in existing_shards:
+        conn = sqlite3.connect(path)
+        try:
+            if _table_exists(conn, 'energy_usage') and conn.execute('SELECT 1 FROM energy_usage LIMIT 1').fetchone():
+                return True
+        finally:
+            conn.close()
+    return False
+
+def reset_database(database=DATABASE):
+    """Swap a freshly initialized database in place of a live one"""
+    initialize = _initializer_for(database)
+    if not os.path.exists(database):
+        initialize(database)
+        return
+    
+    tmp_path = _temp_database_path(database)
+    try:
+        initialize(tmp_path)
+        _swap_in(tmp_path, database)
+    finally:
+        os.remove(tmp_path)
+
 def calculate_monthly_cost(watts, hours_per_day, cost_per_kwh=8.0):
     """Calculate monthly energy cost for a device (Indian rates)"""
     kwh_per_month = (watts * hours_per_day * 30) / 1000
@@ -173,6 +654,138 @@ def is_strong_password(password):
         return False, "Password must contain at least one lowercase letter"
     return True, "Password is strong"
 
+def accepted_encoding():
+    """Pick the best content encoding the client accepts, or None"""
+    available = ['br', 'gzip'] if brotli else ['gzip']
+    return request.accept_encodings.best_match(available)
+
+def compress_body(data, encoding, precompressing=False):
+    """Compress bytes with gzip or brotli, harder when building assets ahead of time"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if precompressing else BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9 if precompressing else COMPRESS_LEVEL, mtime=0)
+
+def is_compressible(mimetype):
+    """Check whether a response or asset of this type is worth compressing"""
+    return mimetype in COMPRESS_MIMETYPES
+
+def load_asset_manifest():
+    """Map of static filename -> fingerprinted filename, empty if assets aren't built"""
+    try:
+        with open(ASSET_MANIFEST) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+asset_manifest = {}
+asset_manifest_mtime = None
+compressed_cache = {}
+
+def current_asset_manifest():
+    """The asset manifest, reloaded whenever `flask build-assets` rewrites it"""
+    global asset_manifest, asset_manifest_mtime
+    try:
+        mtime = os.stat(ASSET_MANIFEST).st_mtime_ns
+    except OSError:
+        mtime = None
+    if mtime != asset_manifest_mtime:
+        asset_manifest = load_asset_manifest()
+        asset_manifest_mtime = mtime
+    return asset_manifest
+
+def is_hashed_asset_name(filename):
+    """Check whether a name looks like one build_assets produced (stem.<hash>.ext)"""
+    return re.search(r'\.[0-9a-f]{12}(\.[^./]+)?$', filename) is not None
+
+def build_assets():
+    """Fingerprint every static file into ASSET_BUILD_DIR with gzip/brotli variants.
+
+    Files from earlier builds are left in place, so pages that still link
+    to them keep working; remove them with prune_assets.
+    """
+    manifest = {}
+    for root, dirs, files in os.walk(app.static_folder):
+        for name in files:
+            source = os.path.join(root, name)
+            filename = os.path.relpath(source, app.static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            
+            stem, ext = os.path.splitext(filename)
+            hashed_name = f"{stem}.{hashlib.md5(data).hexdigest()[:12]}{ext}"
+            dest = os.path.join(ASSET_BUILD_DIR, hashed_name)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if not os.path.exists(dest):
+                with open(dest, 'wb') as f:
+                    f.write(data)
+            
+            if is_compressible(mimetypes.guess_type(filename)[0]) and len(data) >= COMPRESS_MIN_SIZE:
+                with open(dest + '.gz', 'wb') as f:
+                    f.write(compress_body(data, 'gzip', precompressing=True))
+                if brotli:
+                    with open(dest + '.br', 'wb') as f:
+                        f.write(compress_body(data, 'br', precompressing=True))
+            
+            manifest[filename] = hashed_name
+    
+    # Written last and swapped in, so servers never link to files not built yet
+    with open(ASSET_MANIFEST + '.part', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(ASSET_MANIFEST + '.part', ASSET_MANIFEST)
+    return manifest
+
+def prune_assets():
+    """Delete fingerprinted files the current manifest no longer points at"""
+    current = set(current_asset_manifest().values())
+    removed = 0
+    for root, dirs, files in os.walk(ASSET_BUILD_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, ASSET_BUILD_DIR).replace(os.sep, '/')
+            hashed_name = re.sub(r'\.(gz|br)$', '', filename)
+            if is_hashed_asset_name(hashed_name) and hashed_name not in current:
+                os.remove(path)
+                removed += 1
+    return removed
+
+def asset_url_for(endpoint, **values):
+    """url_for that sends static files to their fingerprinted build when there is one"""
+    manifest = current_asset_manifest()
+    if endpoint == 'static' and values.get('filename') in manifest:
+        values['filename'] = manifest[values['filename']]
+        endpoint = 'hashed_asset'
+    return url_for(endpoint, **values)
+
+@app.context_processor
+def inject_asset_url_for():
+    return {'url_for': asset_url_for}
+
+@app.after_request
+def compress_response(response):
+    """Gzip/brotli-compress HTML and JSON responses the client can accept"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or not is_compressible(response.mimetype)):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    encoding = accepted_encoding()
+    data = response.get_data()
+    if not encoding or len(data) < COMPRESS_MIN_SIZE:
+        return response
+    
+    if request.endpoint in COMPRESS_CACHED_ENDPOINTS:
+        key = (request.endpoint, encoding)
+        cached = compressed_cache.get(key)
+        if cached is None or cached[0] != data:
+            cached = compressed_cache[key] = (data, compress_body(data, encoding))
+        compressed = cached[1]
+    else:
+        compressed = compress_body(data, encoding)
+    
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
 @app.route("/")
 def home():
     return render_template("index.html")
@@ -422,15 +1035,17 @@ def dashboard():
         'city': user_row['city'] if 'city' in user_row.keys() else ''
     }
     
-    # Get energy usage
-    cursor.execute('''
+    # Get energy usage from the user's shard
+    shard_conn = get_db_connection(user_id)
+    shard_cursor = shard_conn.cursor()
+    shard_cursor.execute('''
         SELECT id, device_name, power_watts, hours_per_day, monthly_cost 
         FROM energy_usage 
         WHERE user_id = ?
     ''', (user_id,))
     
     devices = []
-    for row in cursor.fetchall():
+    for row in shard_cursor.fetchall():
         devices.append({
             'id': row['id'],
             'device_name': row['device_name'],
@@ -438,6 +1053,7 @@ def dashboard():
             'hours_per_day': row['hours_per_day'],
             'monthly_cost': row['monthly_cost']
         })
+    shard_conn.close()
     
     # Get energy tips
     cursor.execute('SELECT * FROM energy_tips ORDER BY savings_per_year DESC LIMIT 6')
@@ -481,7 +1097,7 @@ def add_device():
     monthly_cost = calculate_monthly_cost(power_watts, hours_per_day, cost_per_kwh)
     
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(session['user_id'])
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -503,7 +1119,7 @@ def delete_device(device_id):
         return redirect(url_for("login"))
     
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(session['user_id'])
         cursor = conn.cursor()
         
         cursor.execute('DELETE FROM energy_usage WHERE id = ? AND user_id = ?', (device_id, session['user_id']))
@@ -590,34 +1206,63 @@ def logout():
     return redirect(url_for("home"))
 
 # API Routes
+COMMON_DEVICES = [
+    {"name": "Refrigerator", "watts": 150, "category": "appliance"},
+    {"name": "LED Light Bulb", "watts": 10, "category": "lighting"},
+    {"name": "Incandescent Bulb", "watts": 60, "category": "lighting"},
+    {"name": "Laptop", "watts": 50, "category": "electronics"},
+    {"name": "Gaming PC", "watts": 500, "category": "electronics"},
+    {"name": "TV 55\" LED", "watts": 120, "category": "electronics"},
+    {"name": "Air Conditioner", "watts": 1500, "category": "hvac"},
+    {"name": "Ceiling Fan", "watts": 75, "category": "hvac"},
+    {"name": "Washing Machine", "watts": 500, "category": "appliance"},
+    {"name": "Water Heater", "watts": 4000, "category": "appliance"},
+    {"name": "Microwave", "watts": 1100, "category": "appliance"},
+    {"name": "Mixer Grinder", "watts": 500, "category": "appliance"},
+    {"name": "Water Purifier", "watts": 50, "category": "appliance"},
+    {"name": "Phone Charger", "watts": 5, "category": "electronics"},
+    {"name": "Set Top Box", "watts": 30, "category": "electronics"},
+    {"name": "WiFi Router", "watts": 10, "category": "electronics"}
+]
+
 @app.route("/api/common-devices")
 def common_devices():
-    devices = [
-        {"name": "Refrigerator", "watts": 150, "category": "appliance"},
-        {"name": "LED Light Bulb", "watts": 10, "category": "lighting"},
-        {"name": "Incandescent Bulb", "watts": 60, "category": "lighting"},
-        {"name": "Laptop", "watts": 50, "category": "electronics"},
-        {"name": "Gaming PC", "watts": 500, "category": "electronics"},
-        {"name": "TV 55\" LED", "watts": 120, "category": "electronics"},
-        {"name": "Air Conditioner", "watts": 1500, "category": "hvac"},
-        {"name": "Ceiling Fan", "watts": 75, "category": "hvac"},
-        {"name": "Washing Machine", "watts": 500, "category": "appliance"},
-        {"name": "Water Heater", "watts": 4000, "category": "appliance"},
-        {"name": "Microwave", "watts": 1100, "category": "appliance"},
-        {"name": "Mixer Grinder", "watts": 500, "category": "appliance"},
-        {"name": "Water Purifier", "watts": 50, "category": "appliance"},
-        {"name": "Phone Charger", "watts": 5, "category": "electronics"},
-        {"name": "Set Top Box", "watts": 30, "category": "electronics"},
-        {"name": "WiFi Router", "watts": 10, "category": "electronics"}
-    ]
-    return jsonify(devices)
-
-
-@app.route("/reset-db")
+    return jsonify(COMMON_DEVICES)
+
+@app.route("/assets/<path:filename>")
+def hashed_asset(filename):
+    """Serve a fingerprinted static file, precompressed when the client allows"""
+    # Only content-hashed names may be cached as immutable, so nothing else is served.
+    # Older builds' files stay reachable for pages cached before a rebuild.
+    if not is_hashed_asset_name(filename):
+        abort(404)
+    path = safe_join(ASSET_BUILD_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    
+    encoding = accepted_encoding()
+    suffix = {'br': '.br', 'gzip': '.gz'}.get(encoding)
+    if not suffix or not os.path.isfile(path + suffix):
+        encoding, suffix = None, ''
+    
+    response = send_file(path + suffix, mimetype=mimetypes.guess_type(filename)[0],
+                         max_age=ASSET_MAX_AGE, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route("/reset-db", methods=["POST"])
 def reset_db():
-    if os.path.exists(DATABASE):
-        os.remove(DATABASE)
-    init_db()
+    # Kept apart from the rotated backups, so repeated resets can't push real data out
+    stamp = create_snapshot_set(RESET_BACKUP_DIR) if has_user_data() else None
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    for database in all_database_paths():
+        reset_database(database)
+    if stamp:
+        return f"Database reset successfully (previous data saved as snapshot {stamp})"
     return "Database reset successfully"
 
 @app.route("/admin/tables")
@@ -654,6 +1299,15 @@ def admin_tables():
     
     conn.close()
     
+    # Per-user tables are merged from every shard
+    for table_name in SHARDED_TABLES:
+        columns, rows = query_all_shards(f"SELECT * FROM {table_name}")
+        table_data[table_name] = {
+            'columns': columns,
+            'rows': rows,
+            'count': len(rows)
+        }
+    
     return render_template("admin_tables.html", tables=table_data)
 
 @app.route("/admin/query", methods=["GET", "POST"])
@@ -670,32 +1324,92 @@ def admin_query():
         query = request.form.get("query", "")
         
         if query:
+            conn = None
             try:
-                conn = get_db_connection()
-                cursor = conn.cursor()
+                is_select = query.strip().upper().startswith('SELECT')
                 
-                if query.strip().upper().startswith('SELECT'):
-                    cursor.execute(query)
-                    results = cursor.fetchall()
-                    
-                    # Get column names
-                    cursor.execute(query)
-                    columns = [description[0] for description in cursor.description]
+                if mentions_sharded_table(query):
+                    # Per-user tables are split across shards: reads run over the
+                    # merged data, writes must go through the app so rows land
+                    # on the right shard
+                    if not is_select:
+                        raise ValueError("Writes to sharded tables (" + ", ".join(SHARDED_TABLES) +
+                                         ") aren't supported here, only SELECT queries")
+                    columns, results = query_merged(query)
                 else:
-                    # For INSERT, UPDATE, DELETE
-                    cursor.execute(query)
-                    conn.commit()
-                    results = [("Query executed successfully",)]
-                    columns = ["Result"]
-                
-                conn.close()
+                    conn = get_db_connection()
+                    cursor = conn.cursor()
+                    
+                    if is_select:
+                        cursor.execute(query)
+                        results = cursor.fetchall()
+                        
+                        # Get column names
+                        cursor.execute(query)
+                        columns = [description[0] for description in cursor.description]
+                    else:
+                        # For INSERT, UPDATE, DELETE
+                        cursor.execute(query)
+                        conn.commit()
+                        results = [("Query executed successfully",)]
+                        columns = ["Result"]
+                    
+                    conn.close()
                 
             except Exception as e:
                 error = str(e)
-                conn.close()
+                if conn:
+                    conn.close()
     
     return render_template("admin_query.html", results=results, error=error, query=query)
 
+# CLI commands (run with `flask --app main <command>`)
+@app.cli.command("backup-db")
+def backup_db_command():
+    """Take a compressed snapshot of the catalog and every shard."""
+    stamp = create_snapshot_set()
+    click.echo(f"Snapshot {stamp} saved to {BACKUP_DIR}/")
+
+@app.cli.command("restore-db")
+@click.argument("snapshot", required=False)
+def restore_db_command(snapshot):
+    """Restore every database from SNAPSHOT (a stamp or one of its files), or the newest."""
+    stamp, directory = snapshot, BACKUP_DIR
+    if snapshot and snapshot.endswith('.db.gz'):
+        stamp, directory = parse_snapshot(snapshot)[1], os.path.dirname(snapshot) or '.'
+    elif snapshot and snapshot not in dict(list_snapshot_sets(directory=BACKUP_DIR)):
+        directory = RESET_BACKUP_DIR
+    if snapshot and not stamp:
+        raise click.ClickException(f"{snapshot} is not a snapshot of this app's databases")
+    
+    restored = restore_snapshot_set(stamp, directory)
+    if not restored and stamp:
+        raise click.ClickException(f"Snapshot set {stamp} is missing or incomplete in {directory}/")
+    if not restored:
+        raise click.ClickException(f"No complete snapshot sets in {BACKUP_DIR}/")
+    click.echo(f"Catalog and {SHARD_COUNT} shards restored from snapshot {restored}")
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    """Fingerprint and precompress everything in static/."""
+    manifest = build_assets()
+    click.echo(f"Built {len(manifest)} assets into {ASSET_BUILD_DIR}")
+
+@app.cli.command("prune-assets")
+def prune_assets_command():
+    """Delete fingerprinted files left over from earlier builds."""
+    removed = prune_assets()
+    click.echo(f"Removed {removed} old asset files from {ASSET_BUILD_DIR}")
+
+@app.cli.command("rebalance-shards")
+def rebalance_shards_command():
+    """Move energy data to the right shard after changing SHARD_COUNT."""
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    for path in all_shard_paths():
+        init_shard(path)
+    moved = rebalance_shards()
+    click.echo(f"Moved {moved} rows across {SHARD_COUNT} shards")
+
 if __name__ == "__main__":
     with app.app_context():
         init_db()
@@ -0,0 +1,198 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import main
+
+
+class StorageTestCase(unittest.TestCase):
+    """Runs every test in a fresh working directory, since the database paths are relative"""
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.old_shard_count = main.SHARD_COUNT
+        self.tmp_dir = tempfile.mkdtemp()
+        os.chdir(self.tmp_dir)
+        main.db_initialized = False
+
+    def tearDown(self):
+        main.SHARD_COUNT = self.old_shard_count
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def add_device(self, user_id, device_name):
+        conn = main.get_db_connection(user_id)
+        conn.execute('''
+            INSERT INTO energy_usage (user_id, device_name, power_watts, hours_per_day, monthly_cost)
+            VALUES (?, ?, 100, 2, 48)
+        ''', (user_id, device_name))
+        conn.commit()
+        conn.close()
+
+    def devices_by_shard(self):
+        """{shard path: sorted [(user_id, device_name)]} for every configured shard"""
+        devices = {}
+        for path in main.all_shard_paths():
+            conn = sqlite3.connect(path)
+            devices[path] = sorted(conn.execute('SELECT user_id, device_name FROM energy_usage').fetchall())
+            conn.close()
+        return devices
+
+    def all_devices(self):
+        return sorted(device for devices in self.devices_by_shard().values() for device in devices)
+
+    def assert_rows_on_their_shards(self):
+        for path, devices in self.devices_by_shard().items():
+            for user_id, _ in devices:
+                self.assertEqual(main.shard_path(main.shard_index(user_id)), path)
+
+
+class ShardMigrationTest(StorageTestCase):
+
+    def create_legacy_catalog(self, devices):
+        """Build a catalog the way it looked before sharding, with energy_usage inside it"""
+        main.init_catalog()
+        conn = sqlite3.connect(main.DATABASE)
+        conn.execute('''
+            CREATE TABLE energy_usage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                device_name TEXT NOT NULL,
+                power_watts INTEGER NOT NULL,
+                hours_per_day REAL NOT NULL,
+                cost_per_kwh REAL DEFAULT 8.0,
+                monthly_cost REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        conn.executemany('''
+            INSERT INTO energy_usage (user_id, device_name, power_watts, hours_per_day, monthly_cost)
+            VALUES (?, ?, 100, 2, 48)
+        ''', devices)
+        conn.commit()
+        conn.close()
+
+    def test_legacy_catalog_rows_move_to_shards(self):
+        devices = [(user_id, f"Fan {user_id}-{n}") for user_id in range(1, 41) for n in range(2)]
+        self.create_legacy_catalog(devices)
+
+        main.init_db()
+
+        self.assertEqual(self.all_devices(), sorted(devices))
+        self.assert_rows_on_their_shards()
+        conn = sqlite3.connect(main.DATABASE)
+        self.assertFalse(main._table_exists(conn, 'energy_usage'))
+        conn.close()
+
+    def test_upgraded_install_works_without_running_main(self):
+        # flask run / gunicorn never call init_db() from the __main__ block
+        self.create_legacy_catalog([(1, 'Old Fridge')])
+        conn = sqlite3.connect(main.DATABASE)
+        conn.execute("INSERT INTO users (email, password) VALUES ('asha@example.in', ?)",
+                     (main.hash_password('Passw0rd1'),))
+        conn.commit()
+        conn.close()
+        client = main.app.test_client()
+
+        client.post('/login', data={'email': 'asha@example.in', 'password': 'Passw0rd1'})
+        response = client.get('/dashboard')
+        added = client.post('/add-device', json={'device_name': 'Fan', 'power_watts': 75, 'hours_per_day': 8})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Old Fridge', response.data)
+        self.assertTrue(added.get_json()['success'])
+        self.assertEqual(self.all_devices(), [(1, 'Fan'), (1, 'Old Fridge')])
+
+    def test_rebalance_after_shard_count_change(self):
+        main.init_db()
+        devices = [(user_id, f"AC {user_id}") for user_id in range(1, 61)]
+        for user_id, device_name in devices:
+            self.add_device(user_id, device_name)
+
+        main.SHARD_COUNT = self.old_shard_count + 2
+        main.init_db()
+        self.assertGreater(main.rebalance_shards(), 0)
+
+        self.assertEqual(self.all_devices(), sorted(devices))
+        self.assert_rows_on_their_shards()
+        self.assertEqual(main.rebalance_shards(), 0)
+
+    def test_interrupted_rebalance_is_finished_without_duplicates(self):
+        main.init_db()
+        self.add_device(7, 'Geyser')
+        source_path = main.shard_path(main.shard_index(7))
+        conn = sqlite3.connect(source_path)
+        source_id = conn.execute('SELECT id FROM energy_usage').fetchone()[0]
+        conn.close()
+
+        # A run that died after copying the row to its new shard but before
+        # deleting the original
+        main.SHARD_COUNT = self.old_shard_count + 3
+        main.init_db()
+        target_path = main.shard_path(main.shard_index(7))
+        self.assertNotEqual(target_path, source_path)
+        conn = sqlite3.connect(target_path)
+        conn.execute('''
+            INSERT INTO energy_usage (user_id, device_name, power_watts, hours_per_day, monthly_cost)
+            VALUES (7, 'Geyser', 100, 2, 48)
+        ''')
+        conn.execute('INSERT INTO rebalance_log (source, source_table, source_id) VALUES (?, ?, ?)',
+                     (os.path.basename(source_path), 'energy_usage', source_id))
+        conn.commit()
+        conn.close()
+
+        main.rebalance_shards()
+
+        self.assertEqual(self.all_devices(), [(7, 'Geyser')])
+        conn = sqlite3.connect(source_path)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM energy_usage').fetchone()[0], 0)
+        conn.close()
+        conn = sqlite3.connect(target_path)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM rebalance_log').fetchone()[0], 0)
+        conn.close()
+
+
+class SnapshotSetTest(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        main.init_db()
+        conn = main.get_db_connection()
+        conn.execute("INSERT INTO users (email, password) VALUES ('asha@example.in', 'x')")
+        conn.commit()
+        conn.close()
+        for user_id in range(1, 11):
+            self.add_device(user_id, f"Fridge {user_id}")
+
+    def user_emails(self):
+        conn = main.get_db_connection()
+        emails = [row['email'] for row in conn.execute('SELECT email FROM users ORDER BY email')]
+        conn.close()
+        return emails
+
+    def test_snapshot_set_round_trip(self):
+        devices, emails = self.all_devices(), self.user_emails()
+        stamp = main.create_snapshot_set()
+
+        conn = main.get_db_connection()
+        conn.execute("INSERT INTO users (email, password) VALUES ('ravi@example.in', 'x')")
+        conn.commit()
+        conn.close()
+        self.add_device(3, 'Microwave')
+
+        self.assertEqual(main.restore_snapshot_set(stamp), stamp)
+        self.assertEqual(self.all_devices(), devices)
+        self.assertEqual(self.user_emails(), emails)
+
+    def test_incomplete_set_is_not_restored(self):
+        stamp = main.create_snapshot_set()
+        os.remove(dict(main.list_snapshot_sets())[stamp][main.shard_path(0)])
+
+        self.assertIsNone(main.restore_snapshot_set(stamp))
+
+
+if __name__ == '__main__':
+    unittest.main()